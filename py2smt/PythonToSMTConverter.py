@@ -1,7 +1,45 @@
 # Author: Yixuan
 
 import ast
-import re
+import sys
+import threading
+from functools import lru_cache
+from typing import Any, Callable, ClassVar, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, Union
+
+# The ast node types used while converting, bound once so each reference is a
+# single global lookup rather than a global plus an attribute lookup on `ast`.
+_Module = ast.Module
+_FunctionDef = ast.FunctionDef
+_Assign = ast.Assign
+_BinOp = ast.BinOp
+_Compare = ast.Compare
+_If = ast.If
+_Expr = ast.Expr
+_Name = ast.Name
+_Constant = ast.Constant
+_BoolOp = ast.BoolOp
+_UnaryOp = ast.UnaryOp
+_Return = ast.Return
+_Add = ast.Add
+_Sub = ast.Sub
+_Mult = ast.Mult
+_Div = ast.Div
+_Mod = ast.Mod
+_Eq = ast.Eq
+_NotEq = ast.NotEq
+_Lt = ast.Lt
+_LtE = ast.LtE
+_Gt = ast.Gt
+_GtE = ast.GtE
+_And = ast.And
+_Or = ast.Or
+_Not = ast.Not
+_USub = ast.USub
+
+# A visitor builds a node's text (None for statements without output) from its children's text.
+_Visitor = Callable[['PythonToSMTConverter', Any, List[Optional[str]]], Optional[str]]
+# A handler is a visitor, or the finished str for nodes that always convert to the same text (operators).
+_Handler = Union[str, _Visitor]
 
 class PythonToSMTConverter:
     """
@@ -25,40 +63,34 @@ class PythonToSMTConverter:
     - The supported return types are 'Int' for integers and 'Bool' for booleans.
     - The input Python code should be a subset of Python, including basic arithmetic operations,
       comparison operators, if statements, and function definitions.
-    - Comments in the Python code are preserved in the conversion process.
+    - Comments and docstrings in the Python code are ignored in the conversion process.
     - The resulting SMT-LIB2 code can be used with SMT solvers for formal verification purposes.
 
     """
 
-    def __init__(self, return_type):
+    _DISPATCH: ClassVar[Dict[type, _Handler]]
+
+    def __init__(self, return_type: str, cache_templates: bool = False) -> None:
         """
         Initialize the PythonToSMTConverter.
 
         Parameters:
         -----------
         return_type (str): The return type for the SMT code. Supported types are 'Int' and 'Bool'.
+        cache_templates (bool): Convert code through per-shape templates, which pays off when
+            many snippets differ only in the variable names and constants used in their bodies.
+            Function and parameter names are part of the shape, so snippets that differ in
+            those never share a template. Subclasses never use templates.
         """
 
-        self.return_type = return_type
-    def remove_comments(self, py_code):
-        """
-        Remove comments from a given Python code.
-        This method parses the input Python code and removes all comments,
-        including both inline comments marked with '#' and multiline comments enclosed in triple quotes.
-        It returns the modified Python code without comments.
-        """
-
-        # Remove # comments
-        lines = py_code.split('\n')
-        lines_without_sharp_comments = [re.split(r'#', line, 1)[0] for line in lines]
+        self.return_type = sys.intern(return_type)
+        self.cache_templates = cache_templates
+        # Compiled templates keyed by (return_type, shape); the oldest entry is evicted first
+        self._templates: Dict[Tuple[str, Tuple[object, ...]], str] = {}
+        # Serializes eviction and insertion when one converter is shared by several threads
+        self._templates_lock = threading.Lock()
 
-        # Join lines without # comments and split by triple quotes to remove """ comments
-        code_without_comments = '\n'.join(lines_without_sharp_comments)
-        code_lines = code_without_comments.split('"""')
-        code_without_all_comments = [code_lines[i] if i % 2 == 0 else '' for i in range(len(code_lines))]
-        return ''.join(code_without_all_comments)
-    
-    def convert(self, node):
+    def convert(self, node: Optional[ast.AST]) -> str:
         """
         Convert an abstract syntax tree (AST) node to its corresponding SMT-LIB2 representation.
 
@@ -82,9 +114,7 @@ class PythonToSMTConverter:
         - ast.If: Represents an if statement.
         - ast.Expr: Represents an expression statement.
         - ast.Name: Represents a variable or identifier.
-        - ast.NameConstant: Represents True, False, or None.
-        - ast.Num: Represents a numeric constant.
-        - ast.Str: Represents a string constant.
+        - ast.Constant: Represents a numeric or string constant, True, False, or None.
         - ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod: Represents specific arithmetic operations.
         - ast.BoolOp: Represents boolean operations (and, or).
         - ast.UnaryOp: Represents unary operations (e.g., not).
@@ -92,118 +122,55 @@ class PythonToSMTConverter:
         - ast.Return: Represents a return statement.
         """
 
-        if node is None:
-            return ''
+        result = self._convert(node, self._DISPATCH)
+        return result if result is not None else ''
 
-        if isinstance(node, ast.Module):
-            return '\n'.join(self.convert(n) for n in node.body)
-        
-        elif isinstance(node, ast.FunctionDef):
-            args = ' '.join(f'({arg.arg} {self.return_type})' for arg in node.args.args)
-            body = '\n'.join(self.convert(n) for n in node.body)
-            return f'(define-fun {node.name} ({args}) {self.return_type} {body})'
-        
-        elif isinstance(node, ast.Assign):
-            targets = ' '.join(self.convert(target) for target in node.targets)
-            value = self.convert(node.value)
-            return f'(let {targets} {value})'
-        
-        elif isinstance(node, ast.BinOp):
-            left = self.convert(node.left)
-            op = self.convert(node.op)
-            right = self.convert(node.right)
-            return f'({op} {left} {right})'
-        
-        elif isinstance(node, ast.Compare):
-            left = self.convert(node.left)
-            ops = ' '.join(self.convert(op) for op in node.ops)
-            comparators = ' '.join(self.convert(comp) for comp in node.comparators)
-            if any(isinstance(op, ast.NotEq) for op in node.ops):
-                return f'(not (= {left} {comparators}))'
-            else:
-                return f'({ops} {left} {comparators})'
-            
-        elif isinstance(node, ast.If):
-            test = self.convert(node.test)
-            body = '\n'.join(self.convert(n) for n in node.body)
-            orelse = '\n'.join(self.convert(n) for n in node.orelse)
-            return f'(ite {test} {body} {orelse})'
-        
-        elif isinstance(node, ast.Expr):
-            return self.convert(node.value)
-        
-        elif isinstance(node, ast.Name):
-            if node.id.lower() == 'true':
-                return 'true'
-            elif node.id.lower() == 'false':
-                return 'false'
-            else:
-                return node.id
-            
-        elif isinstance(node, ast.NameConstant):
-            return str(node.value)
-        
-        elif isinstance(node, ast.Num):
-            return str(node.n)
-        
-        
-        elif isinstance(node, ast.Str):
-            return f'"{node.s}"'
-        
-        elif isinstance(node, ast.Add):
-            return '+'
-        
-        elif isinstance(node, ast.Sub):
-            return '-'
-        
-        elif isinstance(node, ast.Mult):
-            return '*'
-        
-        elif isinstance(node, ast.Div):
-            return 'div'
-        
-        elif isinstance(node, ast.Mod):
-            return 'mod'
-        
-        elif isinstance(node, ast.BoolOp):
-            if isinstance(node.op, ast.And):
-                op = 'and'
-            elif isinstance(node.op, ast.Or):
-                op = 'or'
+    def _convert(self, tree: Optional[ast.AST], dispatch: Dict[type, _Handler]) -> Optional[str]:
+        """
+        Worker behind convert(); walks the tree in post-order with an explicit
+        work stack instead of recursion, so deep expressions cost no Python
+        call frames.
+
+        A node seen for the first time is replaced on the work stack by its
+        (handler, node, number of children) record, pushed below its children.
+        When the record comes back up, the children's results are popped off
+        the results stack and combined by the handler into the node's result.
+        """
+
+        if tree is None:
+            return ''
+        # Loop-invariant lookups bound to locals once, outside the hot loop
+        children_for = _CHILDREN.get
+        handler_for = dispatch.get
+        generic_visit = PythonToSMTConverter.generic_visit
+        type_of = type
+        results: List[Optional[str]] = []
+        work: List[Union[ast.AST, Tuple[_Visitor, ast.AST, int]]] = [tree]
+        while work:
+            item = work.pop()
+            if isinstance(item, tuple):
+                visit, node, n_children = item
+                parts = results[-n_children:]
+                del results[-n_children:]
+                results.append(visit(self, node, parts))
+                continue
+            node_type = type_of(item)
+            handler = handler_for(node_type, generic_visit)
+            if isinstance(handler, str):
+                # Operator nodes are a plain str in the table: no call at all
+                results.append(handler)
+                continue
+            get_children = children_for(node_type)
+            children = get_children(item) if get_children is not None else ()
+            if children:
+                # Combine this node once all of its children are converted
+                work.append((handler, item, len(children)))
+                work.extend(reversed(children))
             else:
-                op = f'UNKNOWN_TYPE_BoolOp_{type(node.op).__name__}'
-            values = ' '.join(self.convert(value) for value in node.values)
-            return f'({op} {values})'
-        
-        elif isinstance(node, ast.UnaryOp):
-            if isinstance(node.op, ast.Not):
-                operand = self.convert(node.operand)
-                return f'(not {operand})'
-            elif isinstance(node.op, ast.USub):
-                operand = self.convert(node.operand)
-                return f'(- {operand})'
-            
-        elif isinstance(node, ast.Eq):
-            return '='
-
-        elif isinstance(node, ast.Lt):
-            return '<'
-        
-        elif isinstance(node, ast.LtE):
-            return '<='
-        
-        elif isinstance(node, ast.Gt):
-            return '>'
-        
-        elif isinstance(node, ast.GtE):
-            return '>='
-        
-        elif isinstance(node, ast.Return):
-            return self.convert(node.value) if node.value else 'nil'
-        else:
-            return f'UNKNOWN_TYPE_{type(node).__name__}'
+                results.append(handler(self, item, []))
+        return results[0]
 
-    def python_to_smt(self, py_code):
+    def python_to_smt(self, py_code: str) -> str:
         """
         Convert Python code to SMT-LIB2 format.
 
@@ -215,7 +182,298 @@ class PythonToSMTConverter:
         --------
         str: The equivalent SMT-LIB2 code.
         """
-        py_code = self.remove_comments(py_code)
-        tree = ast.parse(py_code)
+        # ast.parse already drops '#' comments; docstrings are skipped while converting
+        tree = _parse(py_code)
+        if self._templates_enabled():
+            return self._render(tree)
         return self.convert(tree)
 
+    def python_to_smt_many(self, snippets: Iterable[str]) -> List[str]:
+        """
+        Convert several Python code snippets to SMT-LIB2 format.
+
+        This is equivalent to calling python_to_smt() on each snippet, with the
+        conversion path chosen once for the whole batch.
+
+        Parameters:
+        -----------
+        snippets (iterable of str): Python code snippets to be converted.
+
+        Returns:
+        --------
+        list of str: The equivalent SMT-LIB2 code of each snippet, in order.
+        """
+        parse = _parse
+        to_smt: Callable[[ast.AST], str] = self._render if self._templates_enabled() else self.convert
+        return [to_smt(parse(py_code)) for py_code in snippets]
+
+    def _templates_enabled(self) -> bool:
+        # A subclass may override convert() or read node attributes that a shape
+        # does not record, so only the base class converts through templates.
+        return self.cache_templates and type(self) is PythonToSMTConverter
+
+    def _render(self, tree: ast.AST) -> str:
+        """
+        Convert a parsed tree through a template specialized to its shape.
+
+        Trees that differ only in their leaves (names and constants) convert
+        to the same text around those leaves. That text is compiled once per
+        shape into a %-format string and cached, so a repeated shape costs one
+        fingerprinting walk and a single format operation.
+        """
+
+        shape, leaves = self._fingerprint(tree)
+        key = (self.return_type, shape)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._compile_template(tree)
+            with self._templates_lock:
+                templates = self._templates
+                if key not in templates and len(templates) >= _TEMPLATE_CACHE_SIZE:
+                    del templates[next(iter(templates))]
+                templates[key] = template
+        return template % tuple(leaves)
+
+    def _fingerprint(self, tree: ast.AST) -> Tuple[Tuple[object, ...], List[str]]:
+        """
+        Walk the tree in pre-order and return its shape together with the
+        converted leaves, in the order their slots appear in the template.
+        """
+
+        dispatch = self._DISPATCH
+        children_for = _CHILDREN.get
+        details_for = _DETAILS.get
+        type_of = type
+        shape: List[object] = []
+        leaves: List[str] = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            node_type = type_of(node)
+            if node_type in _LEAVES:
+                shape.append(node_type)
+                handler = dispatch[node_type]
+                leaves.append(handler if isinstance(handler, str) else str(handler(self, node, [])))
+                continue
+            get_children = children_for(node_type)
+            children = get_children(node) if get_children is not None else ()
+            get_details = details_for(node_type)
+            shape.append((node_type, len(children), get_details(node) if get_details is not None else None))
+            stack.extend(reversed(children))
+        return tuple(shape), leaves
+
+    def _compile_template(self, tree: ast.AST) -> str:
+        """
+        Convert the tree with every leaf left as a slot and return the result
+        as a %-format string with one '%s' per slot.
+        """
+
+        dispatch = dict(self._DISPATCH)
+        for leaf_type in _LEAVES:
+            dispatch[leaf_type] = _conv_slot
+        text = self._convert(tree, dispatch)
+        if text is None:
+            return ''
+        return text.replace('%', '%%').replace(_SLOT, '%s')
+
+    # Node handlers. Each one receives the node and the converted text of the
+    # children listed for its type in _CHILDREN, and returns the node's text.
+    # They are named after ast.NodeVisitor: visit_<NodeName> handles that node
+    # class and generic_visit everything else. They are not NodeVisitor
+    # compatible, though, since they take (node, parts) rather than just node.
+    # _DISPATCH, built once when the module is loaded, maps node types straight
+    # to these functions of this class, so finding a handler is one dict lookup
+    # per node; overriding them in a subclass has no effect.
+    #
+    # Templates rely on one rule: every node attribute a handler reads,
+    # other than its children in `parts`, must be recorded for that node
+    # type in _DETAILS (or the type must be one of the _LEAVES). Otherwise
+    # two trees the handler tells apart get the same shape, and a cached
+    # template returns the text of the other tree.
+
+    def generic_visit(self, node: ast.AST, parts: List[Optional[str]]) -> Optional[str]:
+        return f'UNKNOWN_TYPE_{type(node).__name__}'
+
+    def visit_Module(self, node: ast.Module, parts: List[Optional[str]]) -> Optional[str]:
+        return _interleave('\n', parts)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef, parts: List[Optional[str]]) -> Optional[str]:
+        rt = self.return_type
+        names = [arg.arg for arg in node.args.args]
+        # "(a rt) (b rt)" as one join: the separator carries the type of every argument but the last
+        signature = '(' + (' ' + rt + ') (').join(names) + ' ' + rt + ')' if names else ''
+        body = _interleave('\n', parts)
+        return f'(define-fun {node.name} ({signature}) {rt} {body})'
+
+    def visit_Assign(self, node: ast.Assign, parts: List[Optional[str]]) -> Optional[str]:
+        targets = _interleave(' ', parts[:-1])
+        value = parts[-1]
+        return f'(let {targets} {value})'
+
+    def visit_BinOp(self, node: ast.BinOp, parts: List[Optional[str]]) -> Optional[str]:
+        left, op, right = parts
+        return f'({op} {left} {right})'
+
+    def visit_Compare(self, node: ast.Compare, parts: List[Optional[str]]) -> Optional[str]:
+        ops = node.ops
+        n_ops = len(ops)
+        left = parts[0]
+        comparators = _interleave(' ', parts[1 + n_ops:])
+        # Operator nodes are never subclassed, so an exact type check is enough
+        if n_ops == 1:
+            has_not_eq = type(ops[0]) is _NotEq
+        else:
+            has_not_eq = any(type(op) is _NotEq for op in ops)
+        if has_not_eq:
+            return f'(not (= {left} {comparators}))'
+        else:
+            return f"({_interleave(' ', parts[1:1 + n_ops])} {left} {comparators})"
+
+    def visit_If(self, node: ast.If, parts: List[Optional[str]]) -> Optional[str]:
+        n_body = len(node.body)
+        test = parts[0]
+        body = _interleave('\n', parts[1:1 + n_body])
+        # Most ifs have no else branch; skip slicing and joining an empty list
+        orelse = _interleave('\n', parts[1 + n_body:]) if node.orelse else ''
+        return f'(ite {test} {body} {orelse})'
+
+    def visit_Expr(self, node: ast.Expr, parts: List[Optional[str]]) -> Optional[str]:
+        # Docstrings have no children and produce no output
+        return parts[0] if parts else None
+
+    def visit_Name(self, node: ast.Name, parts: List[Optional[str]]) -> Optional[str]:
+        nid = node.id
+        if nid in _TRUE_NAMES:
+            return 'true'
+        if nid in _FALSE_NAMES:
+            return 'false'
+        return nid
+
+    def visit_Constant(self, node: ast.Constant, parts: List[Optional[str]]) -> Optional[str]:
+        value = node.value
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if value is None:
+            return 'nil'
+        if isinstance(value, str):
+            return f'"{value}"'
+        if isinstance(value, (int, float, complex)):
+            return str(value)
+        return PythonToSMTConverter.generic_visit(self, node, parts)
+
+    def visit_BoolOp(self, node: ast.BoolOp, parts: List[Optional[str]]) -> Optional[str]:
+        if isinstance(node.op, _And):
+            op = 'and'
+        elif isinstance(node.op, _Or):
+            op = 'or'
+        else:
+            op = f'UNKNOWN_TYPE_BoolOp_{type(node.op).__name__}'
+        values = _interleave(' ', parts)
+        return f'({op} {values})'
+
+    def visit_UnaryOp(self, node: ast.UnaryOp, parts: List[Optional[str]]) -> Optional[str]:
+        if isinstance(node.op, _Not):
+            return f'(not {parts[0]})'
+        elif isinstance(node.op, _USub):
+            return f'(- {parts[0]})'
+        # Other unary operators are not supported and convert to nothing, as before
+        return None
+
+    def visit_Return(self, node: ast.Return, parts: List[Optional[str]]) -> Optional[str]:
+        return parts[0] if parts else 'nil'
+
+    @classmethod
+    def _build_dispatch(cls) -> Dict[type, _Handler]:
+        """Map ast node types to the visit_<NodeName> methods, and operator types straight to their symbols."""
+        dispatch: Dict[type, _Handler] = dict(_OP_SYMBOL)
+        for name in dir(cls):
+            if name.startswith('visit_'):
+                node_type = getattr(ast, name[len('visit_'):], None)
+                if isinstance(node_type, type) and issubclass(node_type, ast.AST):
+                    dispatch[node_type] = getattr(cls, name)
+        return dispatch
+
+
+@lru_cache(maxsize=256)
+def _parse(py_code: str) -> ast.Module:
+    """
+    ast.parse with the most recent trees kept, so converting the same source
+    again skips tokenizing and parsing. Conversion never mutates the tree.
+    """
+    return ast.parse(py_code)
+
+
+def _interleave(sep: str, parts: Sequence[Optional[str]]) -> str:
+    """sep.join(parts), skipping statements without output."""
+    return sep.join([part for part in parts if part is not None])
+
+
+def _is_docstring(node: ast.Expr) -> bool:
+    """Tell whether an Expr statement is a docstring or other bare string."""
+    return isinstance(node.value, _Constant) and isinstance(node.value.value, str)
+
+
+# Operator nodes carry no children, so they map straight to their SMT-LIB2 symbol;
+# _build_dispatch() puts these str values into the dispatch table as they are.
+# The symbols are interned so every operator node converts to the same str object.
+_OP_SYMBOL: Dict[type, str] = {op_type: sys.intern(symbol) for op_type, symbol in {
+    _Add: '+',
+    _Sub: '-',
+    _Mult: '*',
+    _Div: 'div',
+    _Mod: 'mod',
+    _Eq: '=',
+    _Lt: '<',
+    _LtE: '<=',
+    _Gt: '>',
+    _GtE: '>=',
+}.items()}
+
+
+# Spellings of the boolean literals that are accepted as plain names.
+_TRUE_NAMES: FrozenSet[str] = frozenset(('True', 'true', 'TRUE'))
+_FALSE_NAMES: FrozenSet[str] = frozenset(('False', 'false', 'FALSE'))
+
+
+# Placeholder a template leaf converts to; filled in per call by _render().
+# Identifiers, the only other user text in a template, cannot contain it.
+_SLOT = '\x00'
+
+
+def _conv_slot(self: PythonToSMTConverter, node: ast.AST, parts: List[Optional[str]]) -> Optional[str]:
+    return _SLOT
+
+
+# Child nodes each handler expects in `parts`, in order; types not listed are leaves.
+_CHILDREN: Dict[type, Callable[[Any], Sequence[ast.AST]]] = {
+    _Module: lambda node: node.body,
+    _FunctionDef: lambda node: node.body,
+    _Assign: lambda node: (*node.targets, node.value),
+    _BinOp: lambda node: (node.left, node.op, node.right),
+    _Compare: lambda node: (node.left, *node.ops, *node.comparators),
+    _If: lambda node: (node.test, *node.body, *node.orelse),
+    _Expr: lambda node: () if _is_docstring(node) else (node.value,),
+    _BoolOp: lambda node: node.values,
+    _UnaryOp: lambda node: (node.operand,) if isinstance(node.op, (_Not, _USub)) else (),
+    _Return: lambda node: (node.value,) if node.value else (),
+}
+
+# Node types whose whole conversion becomes a template slot.
+_LEAVES: FrozenSet[type] = frozenset((_Name, _Constant))
+
+# Node attributes, besides children, that a handler's output depends on; every such
+# attribute read by a visit_ method must be listed here for templates to be correct.
+_DETAILS: Dict[type, Callable[[Any], object]] = {
+    _FunctionDef: lambda node: (node.name, tuple(arg.arg for arg in node.args.args)),
+    _Compare: lambda node: len(node.ops),
+    _If: lambda node: len(node.body),
+    _BoolOp: lambda node: type(node.op),
+    _UnaryOp: lambda node: type(node.op),
+}
+
+# Templates each converter keeps before evicting its oldest one.
+_TEMPLATE_CACHE_SIZE = 256
+
+PythonToSMTConverter._DISPATCH = PythonToSMTConverter._build_dispatch()
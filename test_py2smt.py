@@ -1,20 +1,74 @@
-from py2smt.PythonToSMTConverter import PythonToSMTConverter
+import sys
+
+from py2smt.PythonToSMTConverter import PythonToSMTConverter, _parse
 
 class TestPythonToSMTConverter:
     def __init__(self):
         pass
 
-    def run_tests(self, test_cases):
-        for i, (python_code, return_type, expected_output) in enumerate(test_cases, start=1):
-            converter = PythonToSMTConverter(return_type)
-            smt_code = converter.python_to_smt(python_code)
-            print(f"\nRandom Test Case {i}:")
-            print("Python Code:\n", python_code)
-            print("Expected SMT-LIB2 Output:\n", expected_output)
-            print("Actual SMT-LIB2 Output:\n", smt_code)
-            #assert smt_code == expected_output, f"Test Case {i} Failed!\nExpected:\n{expected_output}\nActual:\n{smt_code}"
+    def run_tests(self, test_cases, verbose=False):
+        # Report is collected and printed once, keeping stdout writes out of the conversion loop;
+        # it is printed even when a later case fails, so the cases before it are still reported
+        outputs = []
+        try:
+            for i, (python_code, return_type, expected_output) in enumerate(test_cases, start=1):
+                converter = PythonToSMTConverter(return_type)
+                smt_code = converter.python_to_smt(python_code)
+                if verbose:
+                    outputs.append(f"\nRandom Test Case {i}:")
+                    outputs.append(f"Python Code:\n {python_code}")
+                    outputs.append(f"Expected SMT-LIB2 Output:\n {expected_output}")
+                    outputs.append(f"Actual SMT-LIB2 Output:\n {smt_code}")
+                assert smt_code == expected_output, f"Test Case {i} Failed!\nExpected:\n{expected_output}\nActual:\n{smt_code}"
+        finally:
+            if verbose:
+                print('\n'.join(outputs))
         print("\n\n>>>> All Tests Passed! <<<<\n")
 
+    def run_batch_tests(self, test_cases):
+        # python_to_smt_many must match converting each snippet of the same return type on its own
+        for return_type in sorted({case[1] for case in test_cases}):
+            cases = [case for case in test_cases if case[1] == return_type]
+            converter = PythonToSMTConverter(return_type)
+            smt_codes = converter.python_to_smt_many(python_code for python_code, _, _ in cases)
+            expected_outputs = [expected_output for _, _, expected_output in cases]
+            assert smt_codes == expected_outputs, f"Batch Test ({return_type}) Failed!\nExpected:\n{expected_outputs}\nActual:\n{smt_codes}"
+        print("\n>>>> All Batch Tests Passed! <<<<\n")
+
+    def run_repeat_tests(self, test_cases):
+        # Repeated sources reuse their parsed tree, which earlier conversions (with any return type) must leave intact
+        _parse.cache_clear()
+        for i, (python_code, return_type, expected_output) in enumerate(test_cases, start=1):
+            PythonToSMTConverter('Bool' if return_type == 'Int' else 'Int').python_to_smt(python_code)
+            hits = _parse.cache_info().hits
+            for _ in range(2):
+                smt_code = PythonToSMTConverter(return_type).python_to_smt(python_code)
+                assert smt_code == expected_output, f"Repeat Test Case {i} Failed!\nExpected:\n{expected_output}\nActual:\n{smt_code}"
+            assert _parse.cache_info().hits == hits + 2, f"Repeat Test Case {i} Failed! The parsed tree was not reused"
+        print("\n>>>> All Repeat Tests Passed! <<<<\n")
+
+    def run_deep_tests(self):
+        # Deeply nested expressions convert without recursion, on both conversion paths
+        python_code = 'x = ' + '-' * 1800 + 'y'
+        for cache_templates in (False, True):
+            smt_code = PythonToSMTConverter('Int', cache_templates=cache_templates).python_to_smt(python_code)
+            assert smt_code.startswith('(let x (- (- '), f"Deep Test (cache_templates={cache_templates}) Failed!\nActual:\n{smt_code[:80]}"
+        print("\n>>>> All Deep Tests Passed! <<<<\n")
+
+    def run_template_tests(self, test_cases):
+        # Converting through shape templates must give the same output, whether the template is new or reused
+        for i, (python_code, return_type, expected_output) in enumerate(test_cases, start=1):
+            converter = PythonToSMTConverter(return_type, cache_templates=True)
+            for _ in range(2):
+                smt_code = converter.python_to_smt(python_code)
+                assert smt_code == expected_output, f"Template Test Case {i} Failed!\nExpected:\n{expected_output}\nActual:\n{smt_code}"
+        # Same shape with other constants: the template of the first snippet is filled in again
+        converter = PythonToSMTConverter('Int', cache_templates=True)
+        assert converter.python_to_smt("def f(a):\n    return a + 1\n") == "(define-fun f ((a Int)) Int (+ a 1))"
+        assert converter.python_to_smt("def f(a):\n    return a + 100\n") == "(define-fun f ((a Int)) Int (+ a 100))"
+        assert converter.python_to_smt("def f(a):\n    return '%s' + 1\n") == '(define-fun f ((a Int)) Int (+ "%s" 1))'
+        print("\n>>>> All Template Tests Passed! <<<<\n")
+
 if __name__ == "__main__":
     # Define test cases as tuples: (python_code, return_type, expected_output)
     test_cases = [
@@ -47,12 +101,30 @@ def example_function_2(x, y):\n\
     ", 'Int', """(define-fun example_function_2 ((x Int) (y Int)) Int (let result (+ x y))
 (ite (not (= result 0)) (- 10) (ite (>= result (* 15 x)) (- result) ))
 (mod x y))"""),
+        ("""
+def is_nonzero(flag):
+    if flag != 0:
+        return True
+    return False
+""", 'Bool', """(define-fun is_nonzero ((flag Bool)) Bool (ite (not (= flag 0)) true )
+false)"""),
+        ("""
+def spelled(flag):
+    if flag == TRUE:
+        return TrUe
+    return false
+""", 'Bool', """(define-fun spelled ((flag Bool)) Bool (ite (= flag true) TrUe )
+false)"""),
         # Add more test cases if needed
     ]
 
     test_runner = TestPythonToSMTConverter()
     try:
-        test_runner.run_tests(test_cases)
+        test_runner.run_tests(test_cases, verbose='-v' in sys.argv[1:])
+        test_runner.run_batch_tests(test_cases)
+        test_runner.run_repeat_tests(test_cases)
+        test_runner.run_deep_tests()
+        test_runner.run_template_tests(test_cases)
     except SyntaxError as e:
         print(f"\n\n>>>> Test Failed! <<<<\n")
         print(f"Syntax Error: {e}")